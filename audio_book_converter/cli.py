@@ -2,6 +2,7 @@
 """Command-line interface for Audio Book Converter."""
 
 import argparse
+import logging
 import sys
 from pathlib import Path
 
@@ -10,6 +11,10 @@ from audio_book_converter import AudioBookConverter
 
 def main():
     """Run the command-line interface."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     parser = argparse.ArgumentParser(
         description='Convert and split M4A files to MP3 format.'
     )
@@ -24,6 +29,42 @@ def main():
         default=300,
         help='Time in seconds for each segment (default: 300 seconds/5 minutes)'
     )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Number of files to convert concurrently (default: number of CPUs)'
+    )
+    parser.add_argument(
+        '--threads-per-job',
+        type=int,
+        default=None,
+        help='Number of ffmpeg threads per conversion (default: CPUs divided by jobs)'
+    )
+    parser.add_argument(
+        '--encoder',
+        type=str,
+        default=None,
+        help='ffmpeg audio encoder to use, e.g. mp3, libmp3lame or libfdk_aac (default: mp3)'
+    )
+    parser.add_argument(
+        '--bitrate',
+        type=str,
+        default=None,
+        help='Target audio bitrate, e.g. 128k (default: encoder default)'
+    )
+    parser.add_argument(
+        '--auto-copy',
+        action='store_true',
+        help='Probe inputs with ffprobe and stream-copy audio that is already in the target codec'
+    )
+    parser.add_argument(
+        '--hwaccel',
+        type=str,
+        choices=['qsv', 'vaapi'],
+        default=None,
+        help='Hardware acceleration method for decoding (default: software)'
+    )
 
     args = parser.parse_args()
     source_path = Path(args.source_folder)
@@ -32,7 +73,15 @@ def main():
         print(f"Error: '{source_path}' is not a directory.")
         sys.exit(1)
 
-    converter = AudioBookConverter(segment_time=args.segment_time)
+    converter = AudioBookConverter(
+        segment_time=args.segment_time,
+        max_workers=args.jobs,
+        encoder=args.encoder,
+        bitrate=args.bitrate,
+        hwaccel=args.hwaccel,
+        ffmpeg_threads=args.threads_per_job,
+        auto_copy=args.auto_copy,
+    )
     results = converter.convert_directory(source_path)
 
     if not results:
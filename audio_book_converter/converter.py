@@ -1,16 +1,41 @@
+import asyncio
 import os
+import shlex
 import subprocess
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Union, Dict, Optional, Tuple
+from typing import Callable, List, Union, Dict, Optional, Tuple
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Accepted input extensions (lowercased); a frozenset membership test is a
+# single C-level lookup per file and leaves room for future formats
+_ALLOWED_SUFFIXES = frozenset({".m4a"})
+
+# ffmpeg encoder name -> codec it produces; used to pick a compatible output
+# container and to compare against ffprobe's codec_name in auto_copy mode
+_ENCODER_CODECS = {
+    "mp3": "mp3",
+    "libmp3lame": "mp3",
+    "libshine": "mp3",
+    "aac": "aac",
+    "libfdk_aac": "aac",
+}
+
+# Codec -> segment filename extension. With -f segment, ffmpeg infers each
+# segment's container from this extension and the MP3 muxer rejects non-MP3
+# streams at header-write time, so the extension must match the encoded
+# stream: MP3 in raw .mp3, AAC in ADTS .aac. Codecs not listed here fall
+# back to Matroska, which accepts any audio stream.
+_CODEC_SUFFIXES = {
+    "mp3": ".mp3",
+    "aac": ".aac",
+}
+_FALLBACK_SUFFIX = ".mka"
+
 
 class AudioBookConverter:
     """Converts M4A audio files to MP3 format and splits them into smaller segments.
@@ -20,37 +45,166 @@ class AudioBookConverter:
     devices with limited navigation capabilities.
     """
 
-    def __init__(self, segment_time: int = 300):
+    # No per-instance __dict__: converters are created per settings
+    # combination and cached, so the fixed attribute set keeps them small
+    # and attribute access cheap
+    __slots__ = (
+        "segment_time",
+        "max_workers",
+        "encoder",
+        "bitrate",
+        "hwaccel",
+        "extra_args",
+        "ffmpeg_threads",
+        "auto_copy",
+    )
+
+    def __init__(
+        self,
+        segment_time: int = 300,
+        max_workers: Optional[int] = None,
+        encoder: Optional[str] = None,
+        bitrate: Optional[str] = None,
+        hwaccel: Optional[str] = None,
+        extra_args: Optional[List[str]] = None,
+        ffmpeg_threads: Optional[int] = None,
+        auto_copy: bool = False,
+    ):
         """Initialize the converter with the specified segment time.
 
         Args:
             segment_time: Time in seconds for each segment (default: 300 seconds/5 minutes)
+            max_workers: Maximum number of files to convert concurrently
+                         (default: number of CPUs)
+            encoder: ffmpeg audio encoder to use (default: "mp3"); builds with
+                     libfdk_aac can pass that for a much faster AAC encode
+            bitrate: Target audio bitrate such as "128k" (default: encoder's choice)
+            hwaccel: Hardware acceleration method passed to ffmpeg's -hwaccel,
+                     e.g. "qsv" or "vaapi" (default: software decode)
+            extra_args: Additional arguments spliced into the ffmpeg command
+                        before the output pattern; the ABC_FFMPEG_EXTRA
+                        environment variable is appended to these as well
+            ffmpeg_threads: Number of threads each ffmpeg process may use.
+                            When None, convert_directory divides the CPU count
+                            by the number of concurrent jobs so the combined
+                            load matches the machine.
+            auto_copy: Probe each input with ffprobe and use stream copy
+                       instead of re-encoding when the audio is already in the
+                       target codec (default: False)
         """
         self.segment_time = segment_time
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.encoder = encoder or "mp3"
+        self.bitrate = bitrate
+        self.hwaccel = hwaccel
+        env_extra = os.environ.get("ABC_FFMPEG_EXTRA")
+        self.extra_args = list(extra_args or []) + (shlex.split(env_extra) if env_extra else [])
+        self.ffmpeg_threads = ffmpeg_threads
+        self.auto_copy = auto_copy
 
-    def convert_file(self, input_file: Union[str, Path], output_dir: Optional[Union[str, Path]] = None) -> Tuple[bool, str]:
-        """Convert a single M4A file to MP3 segments.
+    def _hwaccel_args(self) -> List[str]:
+        """Return the global ffmpeg arguments enabling hardware acceleration."""
+        return ["-hwaccel", self.hwaccel] if self.hwaccel else []
+
+    def _codec_args(self) -> List[str]:
+        """Return the per-output ffmpeg arguments selecting codec and bitrate."""
+        args = ["-c:a", self.encoder]
+        if self.bitrate:
+            args += ["-b:a", self.bitrate]
+        args += self.extra_args
+        return args
+
+    def _target_codec(self) -> str:
+        """Return the codec name the configured encoder produces."""
+        return _ENCODER_CODECS.get(self.encoder, self.encoder)
+
+    def _output_suffix(self) -> str:
+        """Return the segment filename extension matching the configured encoder."""
+        return _CODEC_SUFFIXES.get(self._target_codec(), _FALLBACK_SUFFIX)
+
+    def _probe_codec(self, input_path: Path) -> Optional[str]:
+        """Return the codec name of the first audio stream via ffprobe.
 
         Args:
-            input_file: Path to the input M4A file
-            output_dir: Directory where to save the converted files. If None, a directory 
-                        with the same name as the input file will be created in the same location.
+            input_path: Path to the input file to probe
 
         Returns:
-            A tuple containing (success_status, output_directory)
+            The codec name such as "aac" or "mp3", or None if probing fails
         """
-        input_path = Path(input_file)
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe", "-v", "error",
+                    "-select_streams", "a:0",
+                    "-show_entries", "stream=codec_name",
+                    "-of", "csv=p=0",
+                    str(input_path),
+                ],
+                capture_output=True,
+                text=True
+            )
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    def _probe_duration(self, input_path: Path) -> Optional[float]:
+        """Return the duration of an input file in seconds via ffprobe.
+
+        Args:
+            input_path: Path to the input file to probe
+
+        Returns:
+            The duration in seconds, or None if probing fails
+        """
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe", "-v", "error",
+                    "-show_entries", "format=duration",
+                    "-of", "csv=p=0",
+                    str(input_path),
+                ],
+                capture_output=True,
+                text=True
+            )
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+        try:
+            return float(result.stdout.strip())
+        except ValueError:
+            return None
+
+    def _prepare_conversion(self, input_path: Path, output_dir: Optional[Union[str, Path]],
+                            ffmpeg_threads: Optional[int],
+                            skip_mkdir: bool = False) -> Tuple[Optional[List[str]], str]:
+        """Validate an input file and build its ffmpeg command.
 
+        Args:
+            input_path: Path to the input M4A file
+            output_dir: Directory for the converted files, or None to derive
+                        one from the input filename
+            ffmpeg_threads: Per-call override for the number of ffmpeg threads
+            skip_mkdir: Skip creating the output directory; set by callers
+                        that have already created it
+
+        Returns:
+            A tuple of (ffmpeg_command, output_directory) on success, or
+            (None, error_message) when validation fails
+        """
         # Check if the file exists and has the correct extension
         if not input_path.exists():
             error_msg = f"Input file does not exist: {input_path}"
             logger.error(error_msg)
-            return False, error_msg
+            return None, error_msg
 
-        if input_path.suffix.lower() != ".m4a":
+        if input_path.suffix.lower() not in _ALLOWED_SUFFIXES:
             error_msg = f"Input file must be an M4A file, got: {input_path.suffix}"
             logger.error(error_msg)
-            return False, error_msg
+            return None, error_msg
 
         # Create output directory if not specified
         if output_dir is None:
@@ -58,37 +212,274 @@ class AudioBookConverter:
         else:
             output_dir = Path(output_dir)
 
-        output_dir.mkdir(exist_ok=True, parents=True)
+        if not skip_mkdir:
+            output_dir.mkdir(exist_ok=True, parents=True)
+
+        # When the input already carries audio in the target codec, stream
+        # copy makes the whole run a remux — no encoder cycles spent at all.
+        # Compare against the codec the encoder produces, not the encoder
+        # name: ffprobe reports "aac" for libfdk_aac output.
+        codec_args = self._codec_args()
+        if self.auto_copy and self._probe_codec(input_path) == self._target_codec():
+            codec_args = ["-c:a", "copy"]
 
         # Construct the ffmpeg command
         base_name = input_path.stem
+        threads = ffmpeg_threads or self.ffmpeg_threads or 2
         ffmpeg_command = [
             "ffmpeg",
+            *self._hwaccel_args(),  # Optional hardware-accelerated decode
             "-i", str(input_path),  # Input file
+            "-map", "0:a:0",  # Only the first audio stream; skips embedded cover art
+            "-vn", "-sn", "-dn",  # No video/subtitle/data processing at all
+            "-threads", str(threads),  # Cap ffmpeg's own threads so concurrent conversions don't oversubscribe cores
             "-f", "segment",  # Output format is segmented
             "-segment_time", str(self.segment_time),  # Split according to segment_time
-            "-c:a", "mp3",  # Set the audio codec to mp3
+            *codec_args,  # Audio codec, bitrate and any extra arguments
             "-y",  # Overwrite output files without asking
-            str(output_dir / f"%03d_{base_name}.mp3")  # Output filename pattern
+            str(output_dir / f"%03d_{base_name}{self._output_suffix()}")  # Output filename pattern; extension picks each segment's container
         ]
+        return ffmpeg_command, str(output_dir)
+
+    def convert_file(self, input_file: Union[str, Path], output_dir: Optional[Union[str, Path]] = None,
+                     ffmpeg_threads: Optional[int] = None,
+                     progress_callback: Optional[Callable[[float], None]] = None,
+                     _skip_mkdir: bool = False) -> Tuple[bool, str]:
+        """Convert a single M4A file to MP3 segments.
+
+        Args:
+            input_file: Path to the input M4A file
+            output_dir: Directory where to save the converted files. If None, a directory
+                        with the same name as the input file will be created in the same location.
+            ffmpeg_threads: Per-call override for the number of ffmpeg threads;
+                            used by convert_directory to balance concurrent jobs.
+            progress_callback: Called with the completed fraction (0.0-1.0) as
+                               ffmpeg reports progress; requires ffprobe to
+                               determine the input duration.
+
+        Returns:
+            A tuple containing (success_status, output_directory)
+        """
+        input_path = Path(input_file)
+
+        ffmpeg_command, output_dir = self._prepare_conversion(
+            input_path, output_dir, ffmpeg_threads, skip_mkdir=_skip_mkdir
+        )
+        if ffmpeg_command is None:
+            return False, output_dir
+
+        # With a callback, ask ffmpeg for machine-readable progress on stdout
+        # and probe the total duration so positions become fractions
+        duration = None
+        if progress_callback is not None:
+            ffmpeg_command[1:1] = ["-progress", "pipe:1", "-nostats"]
+            duration = self._probe_duration(input_path)
+
+        # Run the ffmpeg command
+        logger.info(f"Processing file: {input_path}")
+        # Streams stay as bytes: decoding ffmpeg's output is pure overhead on
+        # the success path, where it is thrown away
+        process = subprocess.Popen(
+            ffmpeg_command,
+            stdout=subprocess.PIPE if progress_callback is not None else subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+
+        # ffmpeg can emit megabytes of stderr on long books; keep only a
+        # rolling tail so memory stays bounded, and drain the pipe from a
+        # thread so a full pipe buffer can't deadlock the conversion.
+        stderr_tail: deque = deque(maxlen=200)
+
+        def drain_stderr():
+            for line in process.stderr:
+                stderr_tail.append(line)
+
+        reader = threading.Thread(target=drain_stderr, daemon=True)
+        reader.start()
+
+        # Parse "out_time_ms=..." lines as ffmpeg emits them; they report the
+        # current output position in microseconds despite the "_ms" name
+        if progress_callback is not None:
+            for line in process.stdout:
+                if duration and line.startswith(b"out_time_ms="):
+                    try:
+                        position = int(line.split(b"=", 1)[1]) / 1_000_000
+                    except ValueError:
+                        continue
+                    progress_callback(min(1.0, position / duration))
+
+        returncode = process.wait()
+        reader.join()
+
+        if returncode == 0:
+            logger.info(f"Successfully converted {input_path} to MP3 segments")
+            return True, output_dir
+
+        # Decode lazily: only the failure path ever needs the text
+        stderr_text = b"".join(stderr_tail).decode('utf-8', 'replace')
+        error_msg = f"Error converting {input_path}: {stderr_text}"
+        logger.error(error_msg)
+        return False, error_msg
+
+    async def convert_file_async(self, input_file: Union[str, Path],
+                                 output_dir: Optional[Union[str, Path]] = None,
+                                 ffmpeg_threads: Optional[int] = None) -> Tuple[bool, str]:
+        """Convert a single M4A file to MP3 segments without blocking the event loop.
+
+        Async counterpart of convert_file: the ffmpeg subprocess is spawned via
+        asyncio, so many conversions can run concurrently in one event loop
+        without per-file OS threads.
+
+        Args:
+            input_file: Path to the input M4A file
+            output_dir: Directory where to save the converted files. If None, a directory
+                        with the same name as the input file will be created in the same location.
+            ffmpeg_threads: Per-call override for the number of ffmpeg threads
+
+        Returns:
+            A tuple containing (success_status, output_directory)
+        """
+        input_path = Path(input_file)
+
+        # Preparation does blocking work — mkdir and, with auto_copy, a
+        # synchronous ffprobe — so run it in a thread to keep the event loop
+        # free for the other gathered conversions
+        ffmpeg_command, output_dir = await asyncio.to_thread(
+            self._prepare_conversion, input_path, output_dir, ffmpeg_threads
+        )
+        if ffmpeg_command is None:
+            return False, output_dir
+
+        logger.info(f"Processing file: {input_path}")
+        proc = await asyncio.create_subprocess_exec(
+            *ffmpeg_command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await proc.communicate()
+
+        if proc.returncode == 0:
+            logger.info(f"Successfully converted {input_path} to MP3 segments")
+            return True, output_dir
+
+        error_msg = f"Error converting {input_path}: {stderr.decode('utf-8', 'replace')}"
+        logger.error(error_msg)
+        return False, error_msg
+
+    async def convert_directory_async(self, source_folder: Union[str, Path]) -> Dict[str, Tuple[bool, str]]:
+        """Convert all M4A files in a directory to MP3 segments on the event loop.
+
+        Async counterpart of convert_directory: conversions are gathered in one
+        event loop with a semaphore bounding concurrency to max_workers, which
+        scales to hundreds of files without thread stacks.
+
+        Args:
+            source_folder: Path to the folder containing M4A files
+
+        Returns:
+            A dictionary mapping filenames to (success_status, output_directory/error_message) tuples
+        """
+        source_path = Path(source_folder)
+
+        if not source_path.is_dir():
+            logger.error(f"Folder '{source_path}' does not exist.")
+            return {}
+
+        with os.scandir(source_path) as entries:
+            files = [
+                entry.path for entry in entries
+                if entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(".m4a")
+            ]
+        if not files:
+            return {}
+
+        workers = min(len(files), self.max_workers)
+        per_job_threads = self.ffmpeg_threads or max(1, (os.cpu_count() or 1) // workers)
+        semaphore = asyncio.Semaphore(workers)
+
+        async def convert_one(file_path: str) -> Tuple[str, Tuple[bool, str]]:
+            async with semaphore:
+                result = await self.convert_file_async(file_path, ffmpeg_threads=per_job_threads)
+            return os.path.basename(file_path), result
+
+        pairs = await asyncio.gather(*(convert_one(file_path) for file_path in files))
+        return dict(pairs)
+
+    def convert_files(self, input_files: List[Union[str, Path]]) -> Dict[str, Tuple[bool, str]]:
+        """Convert several M4A files to MP3 segments with a single ffmpeg invocation.
+
+        ffmpeg natively supports multiple inputs and outputs in one command, so
+        batching amortizes subprocess startup across the whole set of files.
+        If the batched invocation fails, each file is retried individually via
+        convert_file to isolate the bad input.
+
+        Args:
+            input_files: Paths to the input M4A files
+
+        Returns:
+            A dictionary mapping each input path to a
+            (success_status, output_directory/error_message) tuple; keyed by
+            the full path because batches may mix files from different
+            directories that share a basename
+        """
+        results: Dict[str, Tuple[bool, str]] = {}
+        valid_files: List[Tuple[Path, Path]] = []
+
+        # Validate inputs up front; invalid files get an error entry and are
+        # excluded from the batch so one bad path doesn't sink the whole run.
+        for input_file in input_files:
+            input_path = Path(input_file)
+            if not input_path.exists():
+                error_msg = f"Input file does not exist: {input_path}"
+                logger.error(error_msg)
+                results[str(input_path)] = (False, error_msg)
+                continue
+            if input_path.suffix.lower() not in _ALLOWED_SUFFIXES:
+                error_msg = f"Input file must be an M4A file, got: {input_path.suffix}"
+                logger.error(error_msg)
+                results[str(input_path)] = (False, error_msg)
+                continue
+            output_dir = input_path.parent / input_path.stem
+            output_dir.mkdir(exist_ok=True, parents=True)
+            valid_files.append((input_path, output_dir))
+
+        if not valid_files:
+            return results
+
+        # One command, many inputs: "-i A -i B ... -map 0:a ... -map 1:a ..."
+        ffmpeg_command = ["ffmpeg", "-y", *self._hwaccel_args()]
+        for input_path, _ in valid_files:
+            ffmpeg_command += ["-i", str(input_path)]
+        for index, (input_path, output_dir) in enumerate(valid_files):
+            ffmpeg_command += [
+                "-map", f"{index}:a:0",
+                "-vn", "-sn", "-dn",
+                "-threads", str(self.ffmpeg_threads or 2),
+                "-f", "segment",
+                "-segment_time", str(self.segment_time),
+                *self._codec_args(),
+                str(output_dir / f"%03d_{input_path.stem}{self._output_suffix()}"),
+            ]
 
         try:
-            # Run the ffmpeg command
-            logger.info(f"Processing file: {input_path}")
-            result = subprocess.run(
+            logger.info(f"Processing batch of {len(valid_files)} files")
+            subprocess.run(
                 ffmpeg_command,
                 check=True,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                errors='replace'  # Handle non-UTF8 characters in ffmpeg output
+                stderr=subprocess.PIPE
             )
-            logger.info(f"Successfully converted {input_path} to MP3 segments")
-            return True, str(output_dir)
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error converting {input_path}: {e.stderr}"
-            logger.error(error_msg)
-            return False, error_msg
+            for input_path, output_dir in valid_files:
+                logger.info(f"Successfully converted {input_path} to MP3 segments")
+                results[str(input_path)] = (True, str(output_dir))
+        except subprocess.CalledProcessError:
+            # The batch failed as a whole; retry per file so a single bad
+            # input doesn't mask the results of the others.
+            logger.warning("Batch conversion failed, retrying files individually")
+            for input_path, _ in valid_files:
+                results[str(input_path)] = self.convert_file(input_path)
+
+        return results
 
     def convert_directory(self, source_folder: Union[str, Path]) -> Dict[str, Tuple[bool, str]]:
         """Convert all M4A files in a directory to MP3 segments.
@@ -106,10 +497,40 @@ class AudioBookConverter:
             logger.error(f"Folder '{source_path}' does not exist.")
             return {}
 
+        # Single scandir pass: one syscall per directory entry instead of
+        # glob's per-file Path/stat overhead, and case-insensitive so ".M4A"
+        # rips are picked up as well.
+        with os.scandir(source_path) as entries:
+            files = [
+                entry.path for entry in entries
+                if entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(".m4a")
+            ]
+        if not files:
+            return {}
+
         results = {}
-        # Iterate through files in the source folder
-        for file_path in source_path.glob("*.m4a"):
-            results[file_path.name] = self.convert_file(file_path)
+        # Dispatch conversions concurrently; each one is an ffmpeg subprocess,
+        # so threads spend their time waiting and the work scales across cores.
+        workers = min(len(files), self.max_workers)
+        # Split the CPU budget between jobs unless the caller pinned a thread
+        # count, so N concurrent ffmpegs don't oversubscribe the machine.
+        per_job_threads = self.ffmpeg_threads or max(1, (os.cpu_count() or 1) // workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for file_path in files:
+                # Create each output directory up front (the source folder is
+                # known to exist, so no parents traversal) and tell the worker
+                # to skip its own mkdir — on large folders that saves a
+                # stat+mkdir pair per file.
+                output_dir = source_path / Path(file_path).stem
+                output_dir.mkdir(exist_ok=True)
+                future = executor.submit(
+                    self.convert_file, file_path, output_dir=output_dir,
+                    ffmpeg_threads=per_job_threads, _skip_mkdir=True
+                )
+                futures[future] = os.path.basename(file_path)
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
 
         return results
 
@@ -1,14 +1,25 @@
+import hashlib
 import os
 import logging
-import tempfile
+import queue
+import re
 import shutil
+import threading
 import zipfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict, Any, Union
 
 import gradio as gr
 
+try:
+    # zipstream-ng writes archives as an incremental byte generator with
+    # memory bounded by its internal buffer; optional, zipfile works too
+    from zipstream import ZipStream
+except ImportError:
+    ZipStream = None
+
 from audio_book_converter.converter import AudioBookConverter
 
 
@@ -16,19 +27,173 @@ from audio_book_converter.converter import AudioBookConverter
 OUTPUT_DIR = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / 'output'
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Long-lived worker pool shared by every Gradio request. ffmpeg itself can't
+# act as a persistent job server (one invocation is one job), so the reusable
+# part of the per-request setup — worker threads and converter instances — is
+# kept alive at module scope instead. The pool also bounds how many ffmpeg
+# processes concurrent requests can spawn at once.
+WORKER_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ffmpeg-worker")
+
+# Separate small pool for moving finished segments into the cache. The moves
+# are pure I/O, so a handful of threads overlaps the syscalls and gets much
+# closer to device bandwidth than a serial loop, and keeping the pool at
+# module scope avoids tearing down and respawning threads for every file.
+IO_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="io-worker")
+
+_converters: Dict[Tuple, AudioBookConverter] = {}
+_converters_lock = threading.Lock()
+
+
+def _get_converter(segment_time: int, encoder: Optional[str] = None,
+                   bitrate: Optional[str] = None, hwaccel: Optional[str] = None) -> AudioBookConverter:
+    """Return a shared AudioBookConverter for the given settings.
+
+    Converters are stateless between calls, so one instance per settings
+    combination can serve every request instead of being rebuilt each click.
+
+    Args:
+        segment_time: Time in seconds for each segment
+        encoder: ffmpeg audio encoder to use
+        bitrate: Target audio bitrate
+        hwaccel: Hardware acceleration method
+
+    Returns:
+        A converter configured with the given settings
+    """
+    key = (segment_time, encoder, bitrate, hwaccel)
+    with _converters_lock:
+        converter = _converters.get(key)
+        if converter is None:
+            converter = AudioBookConverter(
+                segment_time=segment_time,
+                encoder=encoder,
+                bitrate=bitrate,
+                hwaccel=hwaccel,
+            )
+            _converters[key] = converter
+    return converter
+
+
+# Matches the converter's segment naming scheme ("012_book.mp3") across the
+# containers it can emit; compiled once so listing a directory of hundreds
+# of segments stays cheap
+_SEGMENT_RE = re.compile(r'^\d{3}_.*\.(?:mp3|aac|mka)$')
+
+
+def _list_segments(directory: Union[str, Path]) -> List[str]:
+    """Return the sorted paths of MP3 segments in a directory.
+
+    A single os.scandir pass with the precompiled name pattern avoids glob's
+    fnmatch translation and per-entry Path allocations; only files produced
+    by the current conversion naming scheme are returned.
+
+    Args:
+        directory: Directory to scan for segment files
+
+    Returns:
+        Sorted list of segment file paths
+    """
+    with os.scandir(directory) as entries:
+        return sorted(entry.path for entry in entries if _SEGMENT_RE.match(entry.name))
+
+
+def _content_key(file_path: Union[str, Path], converter: AudioBookConverter) -> str:
+    """Derive a stable cache key for an upload and the converter handling it.
+
+    Hashing the first 64KB plus the file size is enough to tell audiobooks
+    apart and costs microseconds, so re-uploading the same file with the
+    same settings can reuse the previous conversion instead of redoing
+    minutes of ffmpeg work. The settings half of the key comes from the
+    converter that will actually run, so everything that shapes its output —
+    including extra_args picked up from ABC_FFMPEG_EXTRA — is covered and a
+    settings change can never serve stale segments.
+
+    Args:
+        file_path: Path to the uploaded input file
+        converter: The converter that will perform the conversion
 
-def create_zip_archive(files: List[str], original_filename: str = None) -> str:
+    Returns:
+        A hex digest identifying this (content, settings) combination
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(65536))
+    digest.update(str(os.stat(file_path).st_size).encode())
+    settings = (
+        converter.segment_time,
+        converter.encoder,
+        converter.bitrate,
+        converter.hwaccel,
+        tuple(converter.extra_args),
+        converter.auto_copy,
+    )
+    digest.update(repr(settings).encode())
+    return digest.hexdigest()
+
+
+def _move_or_copy(src: Union[str, Path], dest: Union[str, Path]) -> None:
+    """Move a file to its destination as cheaply as possible.
+
+    The segments are transient per-request files, so stat metadata doesn't
+    need preserving. When source and destination are on the same filesystem
+    a rename is a single syscall with no data moved; otherwise copyfile hits
+    the kernel's sendfile fast path.
+
+    Args:
+        src: Path to the source file
+        dest: Path to the destination file
+    """
+    if os.stat(src).st_dev == os.stat(os.path.dirname(dest)).st_dev:
+        os.rename(src, dest)
+    else:
+        shutil.copyfile(src, dest)
+
+
+def _arc_prefixes(file_paths: List[str]) -> List[str]:
+    """Derive a unique in-zip folder name for each input file.
+
+    Prefixes are based on the input's stem; duplicate stems (two uploads both
+    named book.m4a) get a numeric suffix so their segments land in separate
+    folders instead of colliding on identical arcnames.
+
+    Args:
+        file_paths: The uploaded input files, in order
+
+    Returns:
+        One prefix per input, unique within the list
+    """
+    prefixes = []
+    used = set()
+    for file_path in file_paths:
+        stem = Path(file_path).stem
+        prefix = stem
+        counter = 1
+        while prefix in used:
+            prefix = f"{stem}_{counter}"
+            counter += 1
+        used.add(prefix)
+        prefixes.append(prefix)
+    return prefixes
+
+
+def create_zip_archive(files: List[str], original_filename: str = None,
+                       arcnames: List[str] = None) -> str:
     """Create a zip archive containing all the converted files.
-    
+
     Args:
         files: List of file paths to include in the archive
         original_filename: Name of the original input file to use in the zip name
-        
+        arcnames: Name to give each file inside the archive, aligned with
+            files; defaults to the files' basenames
+
     Returns:
         Path to the created zip archive
     """
     if not files:
         return ""
+
+    if arcnames is None:
+        arcnames = [os.path.basename(file) for file in files]
     
     # Create a zip filename based on the original file name if provided
     timestamp = time.strftime("%Y%m%d-%H%M%S")
@@ -42,87 +207,175 @@ def create_zip_archive(files: List[str], original_filename: str = None) -> str:
         zip_name = f"audiobook_mp3s_{timestamp}.zip"
     
     zip_path = str(OUTPUT_DIR / zip_name)
-    
-    # Create the zip file
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for file in files:
-            zipf.write(file, os.path.basename(file))
-            
+
+    # MP3 data is already compressed, so both paths store rather than
+    # deflate and the archive step is pure I/O. Gradio's file widget needs
+    # a real path, so the zipstream generator is drained to disk; its chunked
+    # output keeps memory bounded regardless of segment sizes.
+    if ZipStream is not None:
+        stream = ZipStream(sized=True)
+        for file, arcname in zip(files, arcnames):
+            stream.add_path(file, arcname)
+        with open(zip_path, 'wb') as zip_file:
+            zip_file.writelines(stream)
+    else:
+        # Fall back to zipfile, one file at a time, so peak memory stays
+        # proportional to the largest single segment
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zipf:
+            for file, arcname in zip(files, arcnames):
+                zipf.write(file, arcname)
+
     return zip_path
 
 
-def process_with_progress(file_path, segment_time: int = 300):
-    """Process a file with progress updates.
-    
+def process_with_progress(file_paths, segment_time: int = 300, encoder: str = "mp3",
+                          bitrate: str = "", hwaccel: str = "none"):
+    """Process one or more files with progress updates.
+
     Args:
-        file_path: Path to the uploaded file from Gradio
+        file_paths: Path or list of paths to the uploaded files from Gradio
         segment_time: Time in seconds for each segment
-        
+        encoder: ffmpeg audio encoder to use
+        bitrate: Target audio bitrate, empty for the encoder default
+        hwaccel: Hardware acceleration method, "none" for software decode
+
     Yields:
         Progress updates and final results
     """
-    if file_path is None:
+    if not file_paths:
         yield [], "Please upload a file first", None
         return
-        
-    # Use the file path directly since we're using type="filepath"
-    input_file_path = file_path
-    
+
+    # A single upload arrives as a bare path; normalize to a list
+    if isinstance(file_paths, (str, Path)):
+        file_paths = [file_paths]
+
     # Initial progress update
-    yield [], "Starting conversion...", None
-    
-    # Convert the file - this part takes time, so we'll simulate progress updates
-    converter = AudioBookConverter(segment_time=segment_time)
+    yield [], f"Starting conversion of {len(file_paths)} file(s)...", None
+
+    converter = _get_converter(
+        segment_time,
+        encoder=encoder or None,
+        bitrate=bitrate or None,
+        hwaccel=None if hwaccel in (None, "", "none") else hwaccel,
+    )
     start_time = time.time()
-    
-    # Do the actual conversion using the original file path
-    success, result = converter.convert_file(input_file_path)
-    
-    if not success:
-        yield [], f"Error: {result}", None
-        return
-        
-    # Get list of converted files
-    output_dir = Path(result)
-    
-    # Create a new unique subfolder in our persistent output directory
-    timestamp = tempfile.mkdtemp(dir=OUTPUT_DIR)
-    persistent_dir = Path(timestamp)
-    
-    # Simple delay for UI responsiveness
-    time.sleep(0.5)
-    
-    # Copy the converted files to the persistent directory
+
+    # Same content plus same settings means the previous conversion can be
+    # served as-is; hashing 64KB is microseconds vs minutes of ffmpeg work.
+    # Whatever is not cached goes to ffmpeg as one batched invocation.
     converted_files = []
-    # Only get files matching our current naming format to avoid showing files from previous conversions
-    for mp3_file in sorted(output_dir.glob("[0-9][0-9][0-9]_*.mp3")):
-        # Copy the file to our persistent directory
-        dest_file = persistent_dir / mp3_file.name
-        shutil.copy2(mp3_file, dest_file)
-        converted_files.append(str(dest_file))
-    
+    # With multiple uploads, segments from inputs sharing a stem would
+    # collide on identical arcnames in the zip, so each input's segments go
+    # under their own folder; a single upload keeps the flat layout
+    namespaced = len(file_paths) > 1
+    zip_arcnames = []
+    reused_count = 0
+    pending = []  # (input_path, persistent_dir, prefix) triples still needing conversion
+    for file_path, prefix in zip(file_paths, _arc_prefixes(file_paths)):
+        cache_key = _content_key(file_path, converter)
+        persistent_dir = OUTPUT_DIR / cache_key
+        if persistent_dir.is_dir():
+            cached_files = _list_segments(persistent_dir)
+            if cached_files:
+                converted_files.extend(cached_files)
+                zip_arcnames.extend(
+                    f"{prefix}/{os.path.basename(f)}" if namespaced
+                    else os.path.basename(f)
+                    for f in cached_files
+                )
+                reused_count += 1
+                continue
+        pending.append((file_path, persistent_dir, prefix))
+
+    if pending:
+        if len(pending) == 1:
+            # Single file: stream ffmpeg's -progress output as percentages so
+            # the user isn't staring at a frozen status for minutes
+            file_path = pending[0][0]
+            progress_updates: queue.Queue = queue.Queue()
+            future = WORKER_POOL.submit(
+                converter.convert_file, file_path,
+                progress_callback=progress_updates.put
+            )
+            last_percent = -1
+            while not future.done():
+                try:
+                    fraction = progress_updates.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                percent = int(fraction * 100)
+                if percent > last_percent:
+                    last_percent = percent
+                    yield converted_files, f"Converting... {percent}%", None
+            results = {str(Path(file_path)): future.result()}
+        else:
+            # One ffmpeg invocation for the whole batch, run on the shared
+            # worker pool so concurrent requests queue behind a bounded
+            # process count
+            results = WORKER_POOL.submit(
+                converter.convert_files, [file_path for file_path, _, _ in pending]
+            ).result()
+
+        for index, (file_path, persistent_dir, prefix) in enumerate(pending):
+            # Results are keyed by full path; Gradio uploads live in separate
+            # temp dirs, so basenames alone could collide across files
+            success, result = results[str(Path(file_path))]
+            if not success:
+                yield [], f"Error: {result}", None
+                return
+
+            # Store results under the content-hash key so identical re-uploads
+            # can be served from this directory next time
+            persistent_dir.mkdir(parents=True, exist_ok=True)
+            mp3_files = _list_segments(result)
+
+            # Move the converted files to the persistent directory so the
+            # individual download links outlive the converter's temporary
+            # output.
+            # A comprehension lets CPython pre-size the destination list from
+            # the source's length hint instead of growing it append by append
+            dest_files = [str(persistent_dir / os.path.basename(f)) for f in mp3_files]
+            # Listing the map drives the pool and propagates any
+            # move/copy error
+            list(IO_POOL.map(_move_or_copy, mp3_files, dest_files))
+            converted_files.extend(dest_files)
+            zip_arcnames.extend(
+                f"{prefix}/{os.path.basename(f)}" if namespaced
+                else os.path.basename(f)
+                for f in dest_files
+            )
+
+            yield converted_files, f"Converted {index + 1} of {len(pending)} file(s)...", None
+
     # Create a zip archive of all the output files
     zip_path = ""
     if converted_files:
-        # Extract the original filename to use for the zip
-        original_filename = os.path.basename(file_path) if file_path else None
-        zip_path = create_zip_archive(converted_files, original_filename)
-        
+        # Name the archive after the book when there is exactly one upload
+        original_filename = os.path.basename(file_paths[0]) if len(file_paths) == 1 else None
+        zip_path = create_zip_archive(converted_files, original_filename, arcnames=zip_arcnames)
+
     # Calculate final elapsed time
     elapsed = time.time() - start_time
     status_message = f"Successfully converted to {len(converted_files)} MP3 segments in {elapsed:.1f} seconds"
-    
+    if reused_count:
+        status_message += f" ({reused_count} file(s) reused from previous conversions)"
+
     # Make sure we're returning proper paths, not booleans
     yield converted_files, status_message, zip_path
 
 
-def process_file(file_obj, segment_time: int = 300):
-    """Process a single file uploaded through the Gradio interface.
-    
+def process_file(file_obj, segment_time: int = 300, encoder: str = "mp3",
+                 bitrate: str = "", hwaccel: str = "none"):
+    """Process files uploaded through the Gradio interface.
+
     Args:
-        file_obj: File object from Gradio (filepath string)
+        file_obj: Filepath string or list of filepath strings from Gradio
         segment_time: Time in seconds for each segment
-        
+        encoder: ffmpeg audio encoder to use
+        bitrate: Target audio bitrate, empty for the encoder default
+        hwaccel: Hardware acceleration method, "none" for software decode
+
     Returns:
         Tuple of (List of file paths, Status message, Zip archive path)
     """
@@ -130,10 +383,10 @@ def process_file(file_obj, segment_time: int = 300):
     # Progress handling is done in the actual implementation
     if file_obj is None or file_obj == "":
         return [], "Please upload a file first", None
-    
+
     try:
         # Use the last value from the generator
-        results = list(process_with_progress(file_obj, segment_time))
+        results = list(process_with_progress(file_obj, segment_time, encoder, bitrate, hwaccel))
         if not results:
             return [], "Error: No results from conversion process", None
             
@@ -161,8 +414,9 @@ def create_interface():
 
         with gr.Row():
             with gr.Column(scale=1):
-                file_input = gr.File(
-                    label="Upload M4A File",
+                file_input = gr.Files(
+                    label="Upload M4A Files",
+                    file_count="multiple",
                     file_types=[".m4a"],
                     type="filepath"  # Use filepath instead of binary for better compatibility
                 )
@@ -173,6 +427,22 @@ def create_interface():
                     value=300,
                     step=30
                 )
+                with gr.Accordion("Encoding Options", open=False):
+                    encoder = gr.Dropdown(
+                        label="Audio Encoder",
+                        choices=["mp3", "libmp3lame", "aac", "libfdk_aac"],
+                        value="mp3"
+                    )
+                    bitrate = gr.Dropdown(
+                        label="Bitrate",
+                        choices=["", "64k", "96k", "128k", "192k"],
+                        value=""
+                    )
+                    hwaccel = gr.Dropdown(
+                        label="Hardware Acceleration",
+                        choices=["none", "qsv", "vaapi"],
+                        value="none"
+                    )
                 convert_button = gr.Button("Convert to MP3", variant="primary")
                 status = gr.Textbox(label="Status", value="Idle")
 
@@ -193,25 +463,33 @@ def create_interface():
                     visible=False  # Start hidden, will be shown after conversion
                 )
         
-        # Handle file conversion with progress updates and update UI
-        def process_and_update_download_all(file_path, segment_time):
-            # Check if file is provided
-            if file_path is None:
-                # No file provided, show error message
-                return [], "Please upload a file first", gr.File(value=None, visible=False)
-                
-            # Process the file and get results
-            files, message, zip_path = process_file(file_path, segment_time)
-            
-            # Update download_all visibility and value
-            download_all_visible = zip_path is not None and zip_path != ""
-            
-            # Return all outputs including visible parameter
-            return files, message, gr.File(value=zip_path, visible=download_all_visible)
-            
+        # Handle file conversion and update UI. Gradio streams each yield of
+        # a generator callback to the browser, so relaying the updates from
+        # process_with_progress is what makes the percentages show up live
+        def process_and_update_download_all(file_paths, segment_time, encoder, bitrate, hwaccel):
+            # Check if files are provided
+            if not file_paths:
+                # No files provided, show error message
+                yield [], "Please upload a file first", gr.File(value=None, visible=False)
+                return
+
+            try:
+                for files, message, zip_path in process_with_progress(
+                        file_paths, segment_time, encoder, bitrate, hwaccel):
+                    # Update download_all visibility and value
+                    download_all_visible = zip_path is not None and zip_path != ""
+                    yield files, message, gr.File(
+                        value=zip_path if download_all_visible else None,
+                        visible=download_all_visible,
+                    )
+            except Exception as e:
+                logging.error(f"Error during file processing: {e}", exc_info=True)
+                yield [], f"Error during conversion: {str(e)}", gr.File(value=None, visible=False)
+
+
         convert_button.click(
             fn=process_and_update_download_all,
-            inputs=[file_input, segment_time],
+            inputs=[file_input, segment_time, encoder, bitrate, hwaccel],
             outputs=[output_files, status, download_all],
             show_progress=True
         )
@@ -222,7 +500,7 @@ def create_interface():
         # Add some descriptive text
         gr.Markdown("""
         ### How to use:
-        1. Upload an M4A audiobook file
+        1. Upload one or more M4A audiobook files
         2. Set the desired segment length in seconds (default: 300 seconds = 5 minutes)
         3. Click 'Convert to MP3' and wait for the process to complete
         4. Click 'Download All Files (ZIP)' to get everything in one file
@@ -233,6 +511,10 @@ def create_interface():
 
 def main():
     """Run the Gradio interface."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     interface = create_interface()
     # Add our output directory to allowed_paths and enable file sharing
     interface.launch(
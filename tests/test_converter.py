@@ -1,10 +1,11 @@
+import asyncio
 import os
 import shutil
 import subprocess
 import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
 from audio_book_converter import AudioBookConverter
 
@@ -26,30 +27,34 @@ class TestAudioBookConverter(unittest.TestCase):
             f.write("dummy content")
         return file_path
 
-    @patch('subprocess.run')
-    def test_convert_file_success(self, mock_subprocess_run):
+    def create_mock_process(self, returncode=0, stderr_lines=None, stdout_lines=None):
+        """Create a mock Popen process emitting bytes output like the real one."""
+        return MagicMock(
+            stdout=iter([line.encode() for line in (stdout_lines or [])]),
+            stderr=iter([line.encode() for line in (stderr_lines or [])]),
+            wait=MagicMock(return_value=returncode)
+        )
+
+    @patch('subprocess.Popen')
+    def test_convert_file_success(self, mock_popen):
         """Test successful conversion of a single file."""
         # Setup mock
-        mock_subprocess_run.return_value = MagicMock(
-            returncode=0,
-            stdout="mocked stdout",
-            stderr="mocked stderr"
-        )
+        mock_popen.return_value = self.create_mock_process(returncode=0)
 
         # Create test file
         test_file = self.create_dummy_m4a_file()
-        
+
         # Call the method
         success, result = self.converter.convert_file(test_file)
-        
+
         # Assertions
         self.assertTrue(success)
         expected_output_dir = test_file.parent / test_file.stem
         self.assertEqual(str(expected_output_dir), result)
-        
+
         # Verify ffmpeg was called with correct parameters
-        mock_subprocess_run.assert_called_once()
-        args, kwargs = mock_subprocess_run.call_args
+        mock_popen.assert_called_once()
+        args, kwargs = mock_popen.call_args
         cmd = args[0]
         self.assertEqual(cmd[0], "ffmpeg")
         self.assertEqual(cmd[1], "-i")
@@ -57,28 +62,47 @@ class TestAudioBookConverter(unittest.TestCase):
         # Find segment_time parameter position
         segment_time_pos = cmd.index("-segment_time") + 1
         self.assertEqual(cmd[segment_time_pos], "60")  # Check segment time
+        # Only the first audio stream is mapped; cover art etc. is skipped
+        self.assertEqual(cmd[cmd.index("-map") + 1], "0:a:0")
+        for flag in ("-vn", "-sn", "-dn"):
+            self.assertIn(flag, cmd)
 
-    @patch('subprocess.run')
-    def test_convert_file_failure(self, mock_subprocess_run):
+    @patch('subprocess.Popen')
+    def test_convert_file_failure(self, mock_popen):
         """Test handling of conversion failure."""
         # Setup mock to simulate failure
-        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
+        mock_popen.return_value = self.create_mock_process(
             returncode=1,
-            cmd="ffmpeg",
-            stderr="mocked error"
+            stderr_lines=["mocked error\n"]
         )
 
         # Create test file
         test_file = self.create_dummy_m4a_file()
-        
+
         # Call the method
         success, result = self.converter.convert_file(test_file)
-        
+
         # Assertions
         self.assertFalse(success)
         self.assertIn("Error converting", result)
         self.assertIn("mocked error", result)
 
+    @patch('subprocess.Popen')
+    def test_convert_file_stderr_tail_is_bounded(self, mock_popen):
+        """Test that only a tail of a very verbose stderr is kept."""
+        mock_popen.return_value = self.create_mock_process(
+            returncode=1,
+            stderr_lines=[f"line {i}\n" for i in range(1000)]
+        )
+
+        test_file = self.create_dummy_m4a_file()
+
+        success, result = self.converter.convert_file(test_file)
+
+        self.assertFalse(success)
+        self.assertNotIn("line 0\n", result)  # Early output was discarded
+        self.assertIn("line 999", result)  # The tail survived
+
     def test_convert_file_nonexistent_file(self):
         """Test handling of non-existent input file."""
         non_existent_file = Path(self.temp_dir) / "nonexistent.m4a"
@@ -103,7 +127,7 @@ class TestAudioBookConverter(unittest.TestCase):
     def test_convert_directory(self, mock_convert_file):
         """Test directory conversion."""
         # Create a deterministic response mapping instead of side_effect sequence
-        def convert_file_side_effect(input_file):
+        def convert_file_side_effect(input_file, **kwargs):
             filename = Path(input_file).name
             if filename == "file1.m4a":
                 return (True, "output_dir1")
@@ -137,6 +161,292 @@ class TestAudioBookConverter(unittest.TestCase):
         self.assertEqual(results["file2.m4a"], (True, "output_dir2"))
         self.assertEqual(results["file3.m4a"], (False, "error message"))
 
+    @patch('audio_book_converter.converter.AudioBookConverter.convert_file')
+    def test_convert_directory_uppercase_extension(self, mock_convert_file):
+        """Test that files with an uppercase .M4A extension are picked up."""
+        mock_convert_file.return_value = (True, "output_dir")
+        self.create_dummy_m4a_file("UPPER.M4A")
+
+        results = self.converter.convert_directory(self.temp_dir)
+
+        self.assertEqual(results, {"UPPER.M4A": (True, "output_dir")})
+
+    @patch('subprocess.run')
+    def test_convert_files_batches_single_invocation(self, mock_subprocess_run):
+        """Test that convert_files converts multiple files with one ffmpeg call."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0)
+
+        file1 = self.create_dummy_m4a_file("file1.m4a")
+        file2 = self.create_dummy_m4a_file("file2.m4a")
+
+        results = self.converter.convert_files([file1, file2])
+
+        self.assertEqual(results[str(file1)], (True, str(file1.parent / file1.stem)))
+        self.assertEqual(results[str(file2)], (True, str(file2.parent / file2.stem)))
+
+        # A single ffmpeg invocation with both inputs and one -map per output
+        mock_subprocess_run.assert_called_once()
+        cmd = mock_subprocess_run.call_args[0][0]
+        self.assertEqual(cmd.count("-i"), 2)
+        self.assertIn("0:a:0", cmd)
+        self.assertIn("1:a:0", cmd)
+
+    @patch('audio_book_converter.converter.AudioBookConverter.convert_file')
+    @patch('subprocess.run')
+    def test_convert_files_falls_back_per_file(self, mock_subprocess_run, mock_convert_file):
+        """Test that a failed batch is retried file by file."""
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
+            returncode=1,
+            cmd="ffmpeg",
+            stderr="mocked error"
+        )
+        mock_convert_file.return_value = (True, "output_dir")
+
+        file1 = self.create_dummy_m4a_file("file1.m4a")
+
+        results = self.converter.convert_files([file1])
+
+        self.assertEqual(results[str(file1)], (True, "output_dir"))
+        mock_convert_file.assert_called_once()
+
+    @patch('subprocess.run')
+    def test_convert_files_duplicate_basenames(self, mock_subprocess_run):
+        """Test that same-named files from different directories don't collide."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0)
+
+        dir1 = Path(self.temp_dir) / "upload1"
+        dir2 = Path(self.temp_dir) / "upload2"
+        for directory in (dir1, dir2):
+            directory.mkdir()
+            with open(directory / "book.m4a", 'w') as f:
+                f.write("dummy content")
+
+        results = self.converter.convert_files([dir1 / "book.m4a", dir2 / "book.m4a"])
+
+        # Both files get their own entry, keyed by full path
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[str(dir1 / "book.m4a")], (True, str(dir1 / "book")))
+        self.assertEqual(results[str(dir2 / "book.m4a")], (True, str(dir2 / "book")))
+
+    def test_convert_files_invalid_input(self):
+        """Test that invalid files are reported without breaking the batch."""
+        missing_file = Path(self.temp_dir) / "missing.m4a"
+        results = self.converter.convert_files([missing_file])
+
+        success, message = results[str(missing_file)]
+        self.assertFalse(success)
+        self.assertIn("does not exist", message)
+
+    @patch('subprocess.Popen')
+    def test_convert_file_custom_codec_args(self, mock_popen):
+        """Test that encoder, bitrate and hwaccel options reach the ffmpeg command."""
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+
+        converter = AudioBookConverter(
+            encoder="libfdk_aac",
+            bitrate="128k",
+            hwaccel="qsv"
+        )
+        test_file = self.create_dummy_m4a_file()
+
+        success, _ = converter.convert_file(test_file)
+
+        self.assertTrue(success)
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-hwaccel") + 1], "qsv")
+        self.assertEqual(cmd[cmd.index("-c:a") + 1], "libfdk_aac")
+        self.assertEqual(cmd[cmd.index("-b:a") + 1], "128k")
+
+    @patch('subprocess.Popen')
+    def test_convert_file_threads_override(self, mock_popen):
+        """Test that ffmpeg_threads controls the -threads argument."""
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+
+        converter = AudioBookConverter(ffmpeg_threads=4)
+        test_file = self.create_dummy_m4a_file()
+
+        converter.convert_file(test_file)
+
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-threads") + 1], "4")
+
+        # Per-call override wins over the constructor value
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+        converter.convert_file(test_file, ffmpeg_threads=1)
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-threads") + 1], "1")
+
+    @patch('subprocess.Popen')
+    def test_output_extension_matches_encoder(self, mock_popen):
+        """Test that the segment extension tracks the selected encoder.
+
+        ffmpeg infers each segment's container from the output extension, so
+        an AAC encode into .mp3-named segments fails at header-write time.
+        """
+        test_file = self.create_dummy_m4a_file()
+
+        # Default MP3 path keeps .mp3 segments
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+        self.converter.convert_file(test_file)
+        self.assertTrue(mock_popen.call_args[0][0][-1].endswith(".mp3"))
+
+        # AAC encoders emit ADTS .aac segments
+        for encoder in ("aac", "libfdk_aac"):
+            mock_popen.return_value = self.create_mock_process(returncode=0)
+            converter = AudioBookConverter(encoder=encoder)
+            converter.convert_file(test_file)
+            self.assertTrue(mock_popen.call_args[0][0][-1].endswith(".aac"))
+
+        # Unrecognized encoders fall back to Matroska, which takes anything
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+        converter = AudioBookConverter(encoder="libopus")
+        converter.convert_file(test_file)
+        self.assertTrue(mock_popen.call_args[0][0][-1].endswith(".mka"))
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_convert_file_auto_copy_encoder_alias(self, mock_popen, mock_subprocess_run):
+        """Test that auto_copy matches ffprobe's codec name against the
+        codec the encoder produces, not the encoder name itself."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0, stdout="aac\n")
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+
+        converter = AudioBookConverter(encoder="libfdk_aac", auto_copy=True)
+        test_file = self.create_dummy_m4a_file()
+
+        converter.convert_file(test_file)
+
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-c:a") + 1], "copy")
+        self.assertTrue(cmd[-1].endswith(".aac"))
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_convert_file_progress_callback(self, mock_popen, mock_subprocess_run):
+        """Test that progress fractions are reported from ffmpeg -progress output."""
+        # ffprobe reports a 600 second book
+        mock_subprocess_run.return_value = MagicMock(returncode=0, stdout="600.0\n")
+        mock_popen.return_value = self.create_mock_process(
+            returncode=0,
+            stdout_lines=[
+                "out_time_ms=300000000\n",  # 300s -> halfway
+                "out_time_ms=600000000\n",  # 600s -> done
+            ]
+        )
+
+        test_file = self.create_dummy_m4a_file()
+        fractions = []
+
+        success, _ = self.converter.convert_file(test_file, progress_callback=fractions.append)
+
+        self.assertTrue(success)
+        self.assertEqual(fractions, [0.5, 1.0])
+        cmd = mock_popen.call_args[0][0]
+        self.assertIn("-progress", cmd)
+        self.assertIn("-nostats", cmd)
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_convert_file_auto_copy(self, mock_popen, mock_subprocess_run):
+        """Test that auto_copy stream-copies when the input codec matches."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0, stdout="mp3\n")
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+
+        converter = AudioBookConverter(auto_copy=True)
+        test_file = self.create_dummy_m4a_file()
+
+        success, _ = converter.convert_file(test_file)
+
+        self.assertTrue(success)
+        # ffprobe was consulted for the codec
+        probe_cmd = mock_subprocess_run.call_args[0][0]
+        self.assertEqual(probe_cmd[0], "ffprobe")
+        # The encode was replaced by a stream copy
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-c:a") + 1], "copy")
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_convert_file_auto_copy_mismatched_codec(self, mock_popen, mock_subprocess_run):
+        """Test that auto_copy still re-encodes when codecs differ."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0, stdout="aac\n")
+        mock_popen.return_value = self.create_mock_process(returncode=0)
+
+        converter = AudioBookConverter(auto_copy=True)
+        test_file = self.create_dummy_m4a_file()
+
+        converter.convert_file(test_file)
+
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("-c:a") + 1], "mp3")
+
+    @patch.dict(os.environ, {"ABC_FFMPEG_EXTRA": "-compression_level 0"})
+    def test_extra_args_from_environment(self):
+        """Test that ABC_FFMPEG_EXTRA is appended to the extra arguments."""
+        converter = AudioBookConverter(extra_args=["-ar", "44100"])
+
+        self.assertEqual(
+            converter.extra_args,
+            ["-ar", "44100", "-compression_level", "0"]
+        )
+
+    @patch('asyncio.create_subprocess_exec')
+    def test_convert_directory_async(self, mock_create_subprocess):
+        """Test the asyncio-based directory conversion path."""
+        mock_proc = MagicMock(returncode=0)
+        mock_proc.communicate = AsyncMock(return_value=(b"", b""))
+        mock_create_subprocess.return_value = mock_proc
+
+        file1 = self.create_dummy_m4a_file("file1.m4a")
+        file2 = self.create_dummy_m4a_file("file2.m4a")
+
+        results = asyncio.run(self.converter.convert_directory_async(self.temp_dir))
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results["file1.m4a"], (True, str(file1.parent / file1.stem)))
+        self.assertEqual(results["file2.m4a"], (True, str(file2.parent / file2.stem)))
+        self.assertEqual(mock_create_subprocess.call_count, 2)
+
+    @patch('subprocess.run')
+    @patch('asyncio.create_subprocess_exec')
+    def test_convert_file_async_auto_copy(self, mock_create_subprocess, mock_subprocess_run):
+        """Test that auto_copy works on the async path too."""
+        mock_subprocess_run.return_value = MagicMock(returncode=0, stdout="mp3\n")
+        mock_proc = MagicMock(returncode=0)
+        mock_proc.communicate = AsyncMock(return_value=(b"", b""))
+        mock_create_subprocess.return_value = mock_proc
+
+        converter = AudioBookConverter(auto_copy=True)
+        test_file = self.create_dummy_m4a_file()
+
+        success, _ = asyncio.run(converter.convert_file_async(test_file))
+
+        self.assertTrue(success)
+        cmd = list(mock_create_subprocess.call_args[0])
+        self.assertEqual(cmd[cmd.index("-c:a") + 1], "copy")
+
+    @patch('asyncio.create_subprocess_exec')
+    def test_convert_file_async_failure(self, mock_create_subprocess):
+        """Test that an ffmpeg failure surfaces through the async path."""
+        mock_proc = MagicMock(returncode=1)
+        mock_proc.communicate = AsyncMock(return_value=(b"", b"mocked error"))
+        mock_create_subprocess.return_value = mock_proc
+
+        test_file = self.create_dummy_m4a_file()
+
+        success, result = asyncio.run(self.converter.convert_file_async(test_file))
+
+        self.assertFalse(success)
+        self.assertIn("mocked error", result)
+
+    def test_max_workers_default_and_override(self):
+        """Test that max_workers defaults to CPU count and can be overridden."""
+        default_converter = AudioBookConverter()
+        self.assertEqual(default_converter.max_workers, os.cpu_count() or 1)
+
+        custom_converter = AudioBookConverter(max_workers=2)
+        self.assertEqual(custom_converter.max_workers, 2)
+
 
 if __name__ == '__main__':
     unittest.main()